@@ -115,11 +115,17 @@ class ImportAtlasLogic(ScriptedLoadableModuleLogic):
   """
 
 
+  # atlases path found for each Lead-DBS path, so the template folders are probed once
+  _atlasesPaths = {}
+
   def getAtlasesPath(self):
     leadDBSPath = slicer.util.settingsValue("NetstimPreferences/leadDBSPath", "", converter=str)
+    if leadDBSPath in ImportAtlasLogic._atlasesPaths:
+      return ImportAtlasLogic._atlasesPaths[leadDBSPath]
     for possibleName in ["MNI_ICBM_2009b_NLIN_ASYM", "MNI152NLin2009bAsym"]:
       possiblePath = os.path.join(leadDBSPath, "templates", "space", possibleName, "atlases")
       if os.path.isdir(possiblePath):
+        ImportAtlasLogic._atlasesPaths[leadDBSPath] = possiblePath
         return possiblePath
     return ""
 
@@ -372,7 +378,7 @@ class LeadDBSAtlas:
 
     try:
       import h5py
-    except:
+    except ImportError:
       slicer.util.pip_install('h5py')
       import h5py
       
@@ -445,11 +451,11 @@ class LeadDBSAtlas:
 
   def readPixdimType(self, atlasFile):
     pixdimType = []
-    for i in range(len(atlasFile['atlases']['pixdim'][0])):
-      ref = atlasFile['atlases']['pixdim'][0,i]
-      data = atlasFile[ref][()]
-      if data.dtype == np.dtype('uint16'):
-        pixdimType.append(''.join(map(chr, np.squeeze(data))))
+    for ref in atlasFile['atlases']['pixdim'][0]:
+      # check the type before reading, numeric pixdims are not needed here
+      dataset = atlasFile[ref]
+      if dataset.dtype == np.dtype('uint16'):
+        pixdimType.append(''.join(map(chr, np.squeeze(dataset[()]))))
       else:
         pixdimType.append('numeric')
     return pixdimType
@@ -365,8 +365,8 @@ class Trajectory():
     shNode.GetItemChildren(shNode.GetSceneItemID(), vtk_ids)
     IDs = [vtk_ids.GetId(i) for i in range(vtk_ids.GetNumberOfIds())]
     for ID in IDs:
-      if 'LeadORTrajectory' in shNode.GetItemAttributeNames(ID):
-        if int(shNode.GetItemAttribute(ID, 'LeadORTrajectory')) == N:
+      trajectoryNumber = shNode.GetItemAttribute(ID, 'LeadORTrajectory')
+      if trajectoryNumber != '' and int(trajectoryNumber) == N:
           return ID
   
   @staticmethod
@@ -376,7 +376,7 @@ class Trajectory():
     shNode.GetItemChildren(shNode.GetSceneItemID(), vtk_ids)
     IDs = [vtk_ids.GetId(i) for i in range(vtk_ids.GetNumberOfIds())]
     for ID in IDs:
-      if 'LeadORTrajectory' in shNode.GetItemAttributeNames(ID):
+      if shNode.GetItemAttribute(ID, 'LeadORTrajectory') != '':
         if shNode.GetItemAttribute(ID, 'ChannelName') == channelName:
           return ID
 
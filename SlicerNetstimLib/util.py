@@ -1,5 +1,4 @@
 import os
-import glob
 import sys
 import json
 import re
@@ -12,6 +11,25 @@ import pydicom as dicom
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "StereotacticPlan"))
 from StereotacticPlanLib.util import StereotaxyReport
 
+#------------------------------------------------------------------------------------------
+def findFiles(directory, prefix='', suffix='', contains=''):
+  """
+  Equivalent of glob(directory/prefix*contains*suffix) for a literal directory.
+  Lists the directory once and filters by name, without pattern matching.
+  Names are compared with os.path.normcase, as glob does (case insensitive on Windows).
+  """
+  if not os.path.isdir(directory):
+    return []
+  prefix, suffix, contains = os.path.normcase(prefix), os.path.normcase(suffix), os.path.normcase(contains)
+  out = []
+  with os.scandir(directory) as entries:
+    for entry in entries:
+      name = os.path.normcase(entry.name)
+      if not name.startswith('.') and len(name) >= len(prefix) + len(suffix)\
+          and name.startswith(prefix) and name.endswith(suffix) and contains in name[len(prefix):len(name)-len(suffix)]:
+        out.append(entry.path)
+  return out
+
 #------------------------------------------------------------------------------------------
 class LeadDBSSubject():
 
@@ -21,6 +39,9 @@ class LeadDBSSubject():
     self.subjectPath = subjectPath
     self.subject = os.path.basename(subjectPath)
     self.leadORPath = os.path.join(self.subjectPath,'leador')
+    self.anatPath = os.path.join(self.subjectPath, 'coregistration', 'anat')
+    self.transformationsPath = os.path.join(self.subjectPath, 'normalization', 'transformations')
+    self._anatFiles = None
     self.stereotaxyReports = self.getStereotaxyReports()
     self.leaddbsPath = leaddbsPath
 
@@ -35,7 +56,7 @@ class LeadDBSSubject():
     return out
 
   def getPossibleStereotaxyReportPaths(self, rootPath):
-    return glob.glob(os.path.join(rootPath, 'StereotaxyReport*.pdf'))
+    return findFiles(rootPath, prefix='StereotaxyReport', suffix='.pdf')
 
   def createORScene(self):
     anatVolumeNode = self.getAnatVolumeNode()
@@ -51,8 +72,7 @@ class LeadDBSSubject():
 
     shnode = slicer.mrmlScene.GetSubjectHierarchyNode()
 
-    for i in range(slicer.mrmlScene.GetNumberOfNodesByClass('vtkMRMLModelNode')):
-      modelNode = slicer.mrmlScene.GetNthNodeByClass(i, 'vtkMRMLModelNode')
+    for modelNode in slicer.util.getNodesByClass('vtkMRMLModelNode'):
       if shnode.GetItemAttribute(shnode.GetItemByDataNode(modelNode),'atlas') == '1':
         modelNode.ApplyTransform(glanatInverseTransformNode.GetTransformToParent())
         modelNode.ApplyTransform(anatToframeTransformNode.GetTransformToParent())
@@ -118,21 +138,27 @@ class LeadDBSSubject():
     return outTransformNode
 
   def getInverseNormalizationNode(self):
-    g = glob.glob(os.path.join(self.subjectPath, 'normalization', 'transformations', '*from-MNI152NLin2009bAsym*-ants.nii.gz'))
+    g = findFiles(self.transformationsPath, suffix='-ants.nii.gz', contains='from-MNI152NLin2009bAsym')
     if g:
       return slicer.util.loadTransform(g[0])
     raise RuntimeError('Unable to find inverse normalization : ' + self.subjectPath)
 
+  def getAnatFiles(self):
+    # coregistered anat images, listed once per subject
+    if self._anatFiles is None:
+      self._anatFiles = findFiles(self.anatPath, suffix='w.nii')
+    return self._anatFiles
+
   def getAnatVolumeNode(self, modality=None):
     modalities = [modality] if modality is not None else ['T2','T1']
     for m in modalities:
-      g = glob.glob(os.path.join(self.subjectPath, 'coregistration', 'anat', '*' + m.upper() + 'w.nii'))
+      g = [f for f in self.getAnatFiles() if os.path.normcase(os.path.basename(f)).endswith(os.path.normcase(m.upper() + 'w.nii'))]
       if g:
         return slicer.util.loadVolume(g[0])
     raise RuntimeError('Unable to find anat volume : ' + self.subjectPath)
 
   def getModalityFromSeriesDescription(self, seriesDescription):
-    for g in glob.glob(os.path.join(self.subjectPath, 'coregistration', 'anat', '*preop*w.nii')):
+    for g in [f for f in self.getAnatFiles() if 'preop' in os.path.normcase(os.path.basename(f))[:-len('w.nii')]]:
       modality = re.search(r'\w+(?=w.nii)', g).group(0)
       if modality.lower() in seriesDescription.lower():
         return modality
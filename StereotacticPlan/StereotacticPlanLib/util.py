@@ -9,7 +9,7 @@ class StereotaxyReport():
   def __init__(self, PDFPath):
     try:
       import pdfplumber
-    except:
+    except ImportError:
       slicer.util.pip_install('pdfplumber')
       import pdfplumber    
       
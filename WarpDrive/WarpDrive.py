@@ -1,14 +1,17 @@
 import os
 import unittest
 import logging
+from functools import partial
 import vtk, qt, ctk, slicer
+from vtk.util import numpy_support
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 
 import numpy as np
+import scipy.linalg
 
 from WarpDriveLib.Tools import NoneTool, SmudgeTool, DrawTool, PointToPointTool
-from WarpDriveLib.Helpers import GridNodeHelper, LeadDBSCall
+from WarpDriveLib.Helpers import GridNodeHelper, LeadDBSCall, RBFHelper
 from WarpDriveLib.Widgets import Tables, Toolbar
 
 #
@@ -50,6 +53,7 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     self.logic = None
     self._parameterNode = None
     self._updatingGUIFromParameterNode = False
+    self._calculatePending = False
 
   def setup(self):
     """
@@ -74,6 +78,9 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
       toolsLayout.addWidget(toolWidget.effectButton)
 
     self.ui.drawModeMenu = toolWidgets[2].effectButton.menu()
+    # draw mode actions are fixed, keep them by text and their exclusive group for lookups
+    self.ui.drawModeActions = {a.text: a for a in self.ui.drawModeMenu.actions()}
+    self.ui.drawModeActionGroup = self.ui.drawModeMenu.actions()[0].actionGroup()
 
     # Add Tree View
     correctionsLayout = qt.QVBoxLayout(self.ui.correctionsFrame)
@@ -108,7 +115,6 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     self.ui.sourceFiducialsComboBox.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
     self.ui.targetFiducialsComboBox.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
     self.ui.outputSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onOutputNodeChanged)
-    self.ui.outputSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
     self.ui.radiusSlider.connect("valueChanged(double)", self.updateParameterNodeFromGUI)
     self.ui.spacingSameAsInputCheckBox.connect("toggled(bool)", self.updateParameterNodeFromGUI)
     self.ui.spacingSpinBox.connect("valueChanged(double)", self.updateParameterNodeFromGUI)
@@ -128,11 +134,12 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     if self._parameterNode.GetParameter("LeadSubjects"): # was called from command line
       self.showSingleModule()
       # put all toolbars in same row
-      slicer.util.mainWindow().addToolBar(Toolbar.reducedToolbar())
-      for tb in slicer.util.mainWindow().findChildren('QToolBar'):
-        slicer.util.mainWindow().removeToolBarBreak(tb)
+      mainWindow = slicer.util.mainWindow()
+      mainWindow.addToolBar(Toolbar.reducedToolbar())
+      for tb in mainWindow.findChildren('QToolBar'):
+        mainWindow.removeToolBarBreak(tb)
       # customize mouse mode
-      mouseModeToolBar = slicer.util.mainWindow().findChild('QToolBar', 'MouseModeToolBar')
+      mouseModeToolBar = mainWindow.findChild('QToolBar', 'MouseModeToolBar')
       mouseModeToolBar.setVisible(1)
       for a in mouseModeToolBar.actions():
         if a.text in ["Fiducial", "Toggle Markups Toolbar"]:
@@ -140,11 +147,14 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
   def showSingleModule(self):
     
+    mainWindow = slicer.util.mainWindow()
+    layoutManager = slicer.app.layoutManager()
+
     # toolbars
     slicer.util.setToolbarsVisible(False, [])
 
     # customize view
-    viewToolBar = slicer.util.mainWindow().findChild('QToolBar', 'ViewToolBar')
+    viewToolBar = mainWindow.findChild('QToolBar', 'ViewToolBar')
     viewToolBar.setVisible(1)
     layoutMenu = viewToolBar.widgetForAction(viewToolBar.actions()[0]).menu()
     for action in layoutMenu.actions():
@@ -152,7 +162,7 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         layoutMenu.removeAction(action)
 
     # viewers
-    viewersToolBar = slicer.util.mainWindow().findChild('QToolBar', 'ViewersToolBar')
+    viewersToolBar = mainWindow.findChild('QToolBar', 'ViewersToolBar')
     viewersToolBar.setVisible(1)
 
     # slicer window
@@ -169,14 +179,13 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
       self.reloadCollapsibleButton.setVisible(False)
 
     # data probe
-    for i in range(slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLScriptedModuleNode")):
-      n  = slicer.mrmlScene.GetNthNodeByClass( i, "vtkMRMLScriptedModuleNode" )
+    for n in slicer.util.getNodesByClass("vtkMRMLScriptedModuleNode"):
       if n.GetModuleName() == "DataProbe":
         n.SetParameter('sliceViewAnnotationsEnabled','0')
 
     # set name
-    slicer.util.mainWindow().setWindowTitle("Warp Drive")
-    slicer.util.mainWindow().showMaximized()
+    mainWindow.setWindowTitle("Warp Drive")
+    mainWindow.showMaximized()
     qt.QApplication.processEvents()
 
     # Set linked slice views  in all existing slice composite nodes and in the default node
@@ -192,15 +201,16 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
     # start-up view
     for color,name in zip(['Red','Green','Yellow'],['Axial','Coronal','Sagittal']):
-      sliceWidget = slicer.app.layoutManager().sliceWidget(color)
-      sliceWidget.mrmlSliceNode().SetName(name)
-      fov = sliceWidget.mrmlSliceNode().GetFieldOfView()
-      sliceWidget.mrmlSliceNode().SetFieldOfView(fov[0]/4,fov[1]/4,fov[2])
+      sliceWidget = layoutManager.sliceWidget(color)
+      sliceNode = sliceWidget.mrmlSliceNode()
+      sliceNode.SetName(name)
+      fov = sliceNode.GetFieldOfView()
+      sliceNode.SetFieldOfView(fov[0]/4,fov[1]/4,fov[2])
       if name == 'Axial':
-        sliceWidget.mrmlSliceNode().SetXYZOrigin(0,-12,0)
+        sliceNode.SetXYZOrigin(0,-12,0)
         sliceWidget.sliceLogic().SetSliceOffset(-8.4)
 
-    slicer.app.layoutManager().setLayout(slicer.vtkMRMLLayoutNode.SlicerLayoutTabbedSliceView)
+    layoutManager.setLayout(slicer.vtkMRMLLayoutNode.SlicerLayoutTabbedSliceView)
 
     qt.QApplication.processEvents()
 
@@ -297,10 +307,14 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     # Need to temporarily block signals to prevent infinite recursion (MRML node update triggers
     # GUI update, which triggers MRML node update, which triggers GUI update, ...)
 
-    self.ui.inputSelector.setCurrentNode(self._parameterNode.GetNodeReference("InputNode"))
+    inputNode = self._parameterNode.GetNodeReference("InputNode")
+    outputNode = self._parameterNode.GetNodeReference("OutputGridTransform")
+    hasInputAndOutput = bool(inputNode and outputNode)
+
+    self.ui.inputSelector.setCurrentNode(inputNode)
     self.ui.sourceFiducialsComboBox.setCurrentNode(self._parameterNode.GetNodeReference("SourceFiducial"))
     self.ui.targetFiducialsComboBox.setCurrentNode(self._parameterNode.GetNodeReference("TargetFiducial"))
-    self.ui.outputSelector.setCurrentNode(self._parameterNode.GetNodeReference("OutputGridTransform"))
+    self.ui.outputSelector.setCurrentNode(outputNode)
 
     radius = float(self._parameterNode.GetParameter("Radius"))
     self.ui.radiusSlider.value = radius
@@ -310,17 +324,19 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     self.ui.spacingSpinBox.value = float(self._parameterNode.GetParameter("Spacing"))
     self.ui.stiffnessSpinBox.value = float(self._parameterNode.GetParameter("Stiffness"))
 
-    self.ui.outputSelector.enabled = self._parameterNode.GetNodeReference("InputNode")
-    self.ui.toolsCollapsibleButton.enabled = self._parameterNode.GetNodeReference("InputNode") and self._parameterNode.GetNodeReference("OutputGridTransform")
-    self.ui.tabWidget.enabled = self._parameterNode.GetNodeReference("InputNode") and self._parameterNode.GetNodeReference("OutputGridTransform")
-    self.ui.outputCollapsibleButton.enabled = self._parameterNode.GetNodeReference("InputNode") and self._parameterNode.GetNodeReference("OutputGridTransform")
-    self.ui.calculateButton.enabled = self._parameterNode.GetNodeReference("InputNode") and self._parameterNode.GetNodeReference("OutputGridTransform")
+    self.ui.outputSelector.enabled = bool(inputNode)
+    self.ui.toolsCollapsibleButton.enabled = hasInputAndOutput
+    self.ui.tabWidget.enabled = hasInputAndOutput
+    self.ui.outputCollapsibleButton.enabled = hasInputAndOutput
+    self.ui.calculateButton.enabled = hasInputAndOutput
 
-    next(filter(lambda a: a.text == self._parameterNode.GetParameter("DrawMode"), self.ui.drawModeMenu.actions())).setChecked(True)
+    self.ui.drawModeActions[self._parameterNode.GetParameter("DrawMode")].setChecked(True)
 
-    # calculate warp
+    # calculate warp (deferred so that a burst of edits triggers a single run)
     if self._parameterNode.GetParameter("Update") == "true" and self._parameterNode.GetParameter("Running") == "false" and self.ui.autoUpdateCheckBox.checked:
-      self.ui.calculateButton.animateClick()
+      if not self._calculatePending:
+        self._calculatePending = True
+        qt.QTimer.singleShot(50, self.onDelayedCalculate)
     
     # set update to false
     self._parameterNode.SetParameter("Update", "false")
@@ -328,6 +344,11 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     # All the GUI updates are done
     self._updatingGUIFromParameterNode = False
 
+  def onDelayedCalculate(self):
+    self._calculatePending = False
+    if self._parameterNode is not None and self._parameterNode.GetParameter("Running") == "false":
+      self.ui.calculateButton.animateClick()
+
   def updateParameterNodeFromGUI(self, caller=None, event=None):
     """
     This method is called when the user makes any change in the GUI.
@@ -349,7 +370,7 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     self._parameterNode.SetNodeReferenceID("SourceFiducial", self.ui.sourceFiducialsComboBox.currentNodeID)
     self._parameterNode.SetNodeReferenceID("TargetFiducial", self.ui.targetFiducialsComboBox.currentNodeID)
     self._parameterNode.SetNodeReferenceID("OutputGridTransform", self.ui.outputSelector.currentNodeID)
-    self._parameterNode.SetParameter("DrawMode", next(filter(lambda a: a.checked, self.ui.drawModeMenu.actions())).text)
+    self._parameterNode.SetParameter("DrawMode", self.ui.drawModeActionGroup.checkedAction().text)
     self._parameterNode.SetParameter("Radius", "%.2f" % self.ui.radiusSlider.value)
     self._parameterNode.SetParameter("Stiffness", str(self.ui.stiffnessSpinBox.value))
     # spacing
@@ -372,6 +393,8 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     # observe
     if self.ui.inputSelector.currentNodeID:
       self.ui.inputSelector.currentNode().SetAndObserveTransformNodeID(self.ui.outputSelector.currentNodeID)
+    # single parameter node update for this selector
+    self.updateParameterNodeFromGUI()
 
 
   def onCalculateButton(self):
@@ -385,43 +408,48 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     # create nodes
     sourceFiducial = self._parameterNode.GetNodeReference("SourceFiducial")
     targetFiducial = self._parameterNode.GetNodeReference("TargetFiducial")
-    # reference
+    # params
+    RBFRadius = ",".join(targetFiducial.GetNthControlPointDescription(i) for i in WarpDriveLogic.selectedControlPointIndexes(targetFiducial))
+    stiffness = float(self._parameterNode.GetParameter("Stiffness"))
+    # reference (voxels only needed when written for the cli, otherwise geometry is enough)
     size,origin,spacing = GridNodeHelper.getGridDefinition(self._parameterNode.GetNodeReference("InputNode"))
     userSpacing = [float(self._parameterNode.GetParameter("Spacing"))] * 3
-    size = np.array(size) * (np.array(spacing) / np.array(userSpacing))
-    auxVolumeNode = GridNodeHelper.emptyVolume([int(s) for s in size], origin, userSpacing)
+    size = [int(s * sp / us) for s,sp,us in zip(size, spacing, userSpacing)]
+    auxVolumeNode = GridNodeHelper.emptyVolume(size, origin, userSpacing, allocateScalars=(RBFRadius != ""))
     # output
     outputNode = self._parameterNode.GetNodeReference("OutputGridTransform")
-    # params
-    RBFRadius = []
-    for i in range(targetFiducial.GetNumberOfControlPoints()):
-      if targetFiducial.GetNthControlPointSelected(i):
-        RBFRadius.append(targetFiducial.GetNthControlPointDescription(i))
-    RBFRadius = ",".join(RBFRadius)
-    stiffness = float(self._parameterNode.GetParameter("Stiffness"))
 
     # save current state if leadDBS call in case of error
     if self._parameterNode.GetParameter("subjectPath") != '':
       LeadDBSCall.saveSourceTarget(self._parameterNode.GetParameter("subjectPath"), sourceFiducial, targetFiducial)
 
     # preview
-    visualizationNodes = self.logic.previewWarp(sourceFiducial, targetFiducial)
+    visualizationNodes = self.logic.previewWarp(sourceFiducial, targetFiducial, 2 * userSpacing[0])
     qt.QApplication.processEvents()
 
     self._parameterNode.SetParameter("Running", "true")
-    cliNode = self.logic.run(auxVolumeNode, outputNode, sourceFiducial, targetFiducial, RBFRadius, stiffness)
+    try:
+      cliNode = self.logic.run(auxVolumeNode, outputNode, sourceFiducial, targetFiducial, RBFRadius, stiffness)
+    except:
+      # clean up so that calculation can run again
+      for node in visualizationNodes:
+        slicer.mrmlScene.RemoveNode(node)
+      slicer.mrmlScene.RemoveNode(auxVolumeNode)
+      qt.QApplication.restoreOverrideCursor()
+      self._parameterNode.SetParameter("Running", "false")
+      raise
 
     if cliNode is not None:
       # set up for UI
       self.ui.landwarpWidget.setCurrentCommandLineModuleNode(cliNode)
       # add observer
       cliNode.AddObserver(slicer.vtkMRMLCommandLineModuleNode.StatusModifiedEvent, \
-        lambda c,e,o=outputNode,v=visualizationNodes,a=auxVolumeNode: self.onStatusModifiedEvent(c,o,v,a))
+        partial(self.onStatusModifiedEvent, outputNode=outputNode, visualizationNodes=visualizationNodes, auxVolumeNode=auxVolumeNode))
     else:
-      self.onStatusModifiedEvent(None,outputNode,visualizationNodes,auxVolumeNode)
+      self.onStatusModifiedEvent(None, outputNode=outputNode, visualizationNodes=visualizationNodes, auxVolumeNode=auxVolumeNode)
     
   
-  def onStatusModifiedEvent(self, caller, outputNode, visualizationNodes, auxVolumeNode):
+  def onStatusModifiedEvent(self, caller, event=None, *, outputNode, visualizationNodes, auxVolumeNode):
     
     if isinstance(caller, slicer.vtkMRMLCommandLineModuleNode):
       if caller.GetStatusString() == 'Completed':
@@ -430,13 +458,22 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
       else:
         return
 
-    self._parameterNode.GetNodeReference("InputNode").SetAndObserveTransformNodeID(outputNode.GetID())
-    self._parameterNode.GetNodeReference("InputNode").Modified()
+    # batch the transform update and node removals so views update once
+    slicer.mrmlScene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+    try:
+      if self._parameterNode.GetParameter("HighPrecisionTransform") == "false":
+        GridNodeHelper.quantizeGridTransform(outputNode)
 
-    # remove aux
-    for node in visualizationNodes:
-      slicer.mrmlScene.RemoveNode(node)
-    slicer.mrmlScene.RemoveNode(auxVolumeNode)
+      inputNode = self._parameterNode.GetNodeReference("InputNode")
+      inputNode.SetAndObserveTransformNodeID(outputNode.GetID())
+      inputNode.Modified()
+
+      # remove aux
+      for node in visualizationNodes:
+        slicer.mrmlScene.RemoveNode(node)
+      slicer.mrmlScene.RemoveNode(auxVolumeNode)
+    finally:
+      slicer.mrmlScene.EndState(slicer.vtkMRMLScene.BatchProcessState)
 
     qt.QApplication.setOverrideCursor(qt.Qt.ArrowCursor)
 
@@ -444,6 +481,62 @@ class WarpDriveWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
 
 
+#
+# Developer mode reload
+#
+
+_devReloaded = False
+_developerMode = None
+
+def isDeveloperMode():
+  """
+  Developer mode setting, read once per session.
+  """
+  global _developerMode
+  if _developerMode is None:
+    _developerMode = slicer.util.settingsValue('Developer/DeveloperMode', False, converter=slicer.util.toBool)
+  return _developerMode
+
+def devReloadOnce():
+  """
+  Reload WarpDriveLib modules if any of them changed since it was compiled.
+  Done only once each time this module is (re)loaded.
+  """
+  global _devReloaded
+  if _devReloaded:
+    return
+  _devReloaded = True
+  import WarpDriveLib
+  import importlib
+  import importlib.util
+  warpDrivePath = os.path.split(__file__)[0]
+  modulesParts = []
+  changed = False
+  for root, dirs, files in os.walk(os.path.join(warpDrivePath, 'WarpDriveLib')):
+    dirs[:] = [d for d in dirs if d != '__pycache__']
+    for fileName in files:
+      if not fileName.endswith('.py'):
+        continue
+      filePath = os.path.join(root, fileName)
+      relativePath = os.path.relpath(filePath, warpDrivePath) # relative path
+      relativePath = os.path.splitext(relativePath)[0] # get rid of .py
+      moduleParts = relativePath.split(os.path.sep) # separate
+      if moduleParts[-1] == '__init__':
+        moduleParts = moduleParts[:-1]
+      modulesParts.append(moduleParts)
+      # compiled file is older than source when it was modified after the last import
+      cachedPath = importlib.util.cache_from_source(filePath)
+      if not os.path.isfile(cachedPath) or os.path.getmtime(cachedPath) < os.path.getmtime(filePath):
+        changed = True
+  if not changed:
+    return
+  for moduleParts in modulesParts:
+    importlib.import_module('.'.join(moduleParts)) # import module
+    module = WarpDriveLib
+    for i in range(1,len(moduleParts)): # iterate over parts in order to load subpkgs
+      module = getattr(module, moduleParts[i])
+    importlib.reload(module) # reload
+
 #
 # WarpDriveLogic
 #
@@ -460,22 +553,13 @@ class WarpDriveLogic(ScriptedLoadableModuleLogic):
 
   def __init__(self):
     ScriptedLoadableModuleLogic.__init__(self)
-    if slicer.util.settingsValue('Developer/DeveloperMode', False, converter=slicer.util.toBool):
-      import WarpDriveLib
-      import importlib
-      import glob
-      warpDrivePath = os.path.split(__file__)[0]
-      G = glob.glob(os.path.join(warpDrivePath, 'WarpDriveLib','**','*.py'))
-      for g in G:
-        relativePath = os.path.relpath(g, warpDrivePath) # relative path
-        relativePath = os.path.splitext(relativePath)[0] # get rid of .py
-        moduleParts = relativePath.split(os.path.sep) # separate
-        importlib.import_module('.'.join(moduleParts)) # import module
-        module = WarpDriveLib
-        for i in range(1,len(moduleParts)): # iterate over parts in order to load subpkgs
-          module = getattr(module, moduleParts[i])
-        importlib.reload(module) # reload
-    
+    self._rbfPatchCache = {}
+    self._rbfCholesky = None
+    self._rbfPoints = None
+    self._rbfRadii = None
+    self._rbfStiffness = None
+    if isDeveloperMode():
+      devReloadOnce()
 
   def setDefaultParameters(self, parameterNode):
     """
@@ -493,6 +577,12 @@ class WarpDriveLogic(ScriptedLoadableModuleLogic):
       parameterNode.SetParameter("DrawMode", 'To Nearest Model')
     if not parameterNode.GetParameter("Running"):
       parameterNode.SetParameter("Running", "false")
+    if not parameterNode.GetParameter("UseCompactRBF"):
+      parameterNode.SetParameter("UseCompactRBF", "false")
+    if not parameterNode.GetParameter("GPUCompute"):
+      parameterNode.SetParameter("GPUCompute", "false")
+    if not parameterNode.GetParameter("HighPrecisionTransform"):
+      parameterNode.SetParameter("HighPrecisionTransform", "true")
 
   def run(self, referenceVolume, outputNode, sourceFiducial, targetFiducial, RBFRadius, stiffness):
 
@@ -506,6 +596,19 @@ class WarpDriveLogic(ScriptedLoadableModuleLogic):
 
   def computeWarp(self, referenceVolume, outputNode, sourceFiducial, targetFiducial, RBFRadius, stiffness):
 
+    # Compute the warp on the gpu if requested and available
+    if self.getParameterNode().GetParameter("GPUCompute") == "true":
+      try:
+        import cupy
+      except ImportError:
+        logging.warning("cupy not available, computing warp with fiducialRegistrationVariableRBF")
+      else:
+        try:
+          self.computeWarpGPU(cupy, referenceVolume, outputNode, sourceFiducial, targetFiducial, RBFRadius, stiffness)
+          return
+        except (cupy.cuda.runtime.CUDARuntimeError, cupy.cuda.driver.CUDADriverError, cupy.cuda.memory.OutOfMemoryError) as e:
+          logging.warning("GPU computation failed (%s), computing warp with fiducialRegistrationVariableRBF" % e)
+
     # Compute the warp with fiducialRegistrationVariableRBF
     cliParams = {
       "referenceVolume" : referenceVolume.GetID(),
@@ -520,28 +623,77 @@ class WarpDriveLogic(ScriptedLoadableModuleLogic):
 
     return cliNode
 
-  def previewWarp(self, source, target):
+  def computeWarpGPU(self, cupy, referenceVolume, outputNode, sourceFiducial, targetFiducial, RBFRadius, stiffness):
+    # selected points, as passed to the cli
+    selectedIndexes = self.selectedControlPointIndexes(targetFiducial)
+    fixedPoints = slicer.util.arrayFromMarkupsControlPoints(targetFiducial)[selectedIndexes]
+    movingPoints = slicer.util.arrayFromMarkupsControlPoints(sourceFiducial)[selectedIndexes]
+    radii = np.array([float(r) for r in RBFRadius.split(",")])
+    if radii.size == 1:
+      radii = np.repeat(radii, len(selectedIndexes))
+    # small system solved on the cpu, dense field evaluated on the gpu
+    coefficients = self.solveGaussianRBF(fixedPoints, movingPoints, radii, stiffness)
+    size = referenceVolume.GetImageData().GetDimensions()
+    origin = referenceVolume.GetOrigin()
+    spacing = referenceVolume.GetSpacing()
+    displacement = RBFHelper.evaluateGaussianRBFGrid(size, origin, spacing, fixedPoints, radii, coefficients, xp=cupy)
+    outputNode.SetAndObserveTransformFromParent(RBFHelper.gridTransformFromDisplacement(displacement, size, origin, spacing))
+
+  def solveGaussianRBF(self, fixedPoints, movingPoints, radii, stiffness):
+    # reuse the cholesky factor of the previous solve if the points are the same or one was appended
+    # (a cached factor already passed the positive definiteness check for the same system)
+    L = None
+    if self._rbfCholesky is not None and stiffness == self._rbfStiffness:
+      n = self._rbfPoints.shape[0]
+      samePrevious = fixedPoints.shape[0] in [n, n+1] and np.array_equal(fixedPoints[:n], self._rbfPoints) and np.array_equal(radii[:n], self._rbfRadii)
+      if samePrevious and fixedPoints.shape[0] == n:
+        L = self._rbfCholesky
+        phi = RBFHelper.gaussianRBFKernel(fixedPoints, radii)[0]
+      elif samePrevious and (stiffness == 0 or radii.mean() == self._rbfRadii.mean()):
+        L, phi = RBFHelper.gaussianRBFCholeskyAppendPoint(self._rbfCholesky, fixedPoints, radii, stiffness)
+    if L is None:
+      L, phi = RBFHelper.gaussianRBFCholesky(fixedPoints, radii, stiffness)
+    if L is None:
+      # not safely positive definite, solve with svd and do not cache
+      self._rbfCholesky = None
+      return RBFHelper.gaussianRBFCoefficients(fixedPoints, movingPoints, radii, stiffness)
+    self._rbfCholesky = L
+    self._rbfPoints = fixedPoints.copy()
+    self._rbfRadii = radii.copy()
+    self._rbfStiffness = stiffness
+    return scipy.linalg.cho_solve((L, True), phi.T @ (movingPoints - fixedPoints))
+
+  def previewWarp(self, source, target, spacing=4.0):
     if isinstance(source, slicer.vtkMRMLMarkupsFiducialNode) and isinstance(target, slicer.vtkMRMLMarkupsFiducialNode):
-      sourcePoints = vtk.vtkPoints()
-      targetPoints = vtk.vtkPoints()
-      for i in range(target.GetNumberOfControlPoints()):
-        if target.GetNthControlPointSelected(i):
-          sourcePoints.InsertNextPoint(source.GetNthControlPointPosition(i))
-          targetPoints.InsertNextPoint(target.GetNthControlPointPosition(i))
+      # fetch all positions at once and keep the selected ones
+      selectedIndexes = self.selectedControlPointIndexes(target)
+      sourceArray = slicer.util.arrayFromMarkupsControlPoints(source)[selectedIndexes]
+      targetArray = slicer.util.arrayFromMarkupsControlPoints(target)[selectedIndexes]
+      pointIDs = [target.GetNthControlPointID(i) for i in selectedIndexes]
     else:
-      sourcePoints = source
-      targetPoints = target
+      sourceArray = numpy_support.vtk_to_numpy(source.GetData()).astype(np.float64).reshape(-1, 3)
+      targetArray = numpy_support.vtk_to_numpy(target.GetData()).astype(np.float64).reshape(-1, 3)
+      selectedIndexes = []
+      pointIDs = []
+    if not sourceArray.shape[0]:
+      # nothing to preview, callers iterate over the returned nodes
+      return []
+    sourcePoints = vtk.vtkPoints()
+    sourcePoints.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(sourceArray), deep=1))
     sourceDisplayFiducial = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMarkupsFiducialNode')
     sourceDisplayFiducial.GetDisplayNode().SetVisibility(0)
     sourceDisplayFiducial.SetControlPointPositionsWorld(sourcePoints)
-    # thin plate
-    transform=vtk.vtkThinPlateSplineTransform()
-    transform.SetSourceLandmarks(sourcePoints)
-    transform.SetTargetLandmarks(targetPoints)
-    transform.SetBasisToR()
-    transform.Inverse()
+    # rbf evaluated on a coarse grid
     transformNode=slicer.mrmlScene.AddNewNodeByClass('vtkMRMLTransformNode')
-    transformNode.SetAndObserveTransformFromParent(transform)
+    if self.getParameterNode().GetParameter("UseCompactRBF") == "true":
+      # radii only needed here, points without a numeric radius use the default one
+      defaultRadius = float(self.getParameterNode().GetParameter("RBFRadius"))
+      radii = [self.getControlPointRadius(target, i, defaultRadius) for i in selectedIndexes] if selectedIndexes else [defaultRadius] * sourceArray.shape[0]
+      transform = self.compactRBFGridTransform(sourceArray, targetArray, radii, pointIDs, spacing)
+    else:
+      transform = RBFHelper.thinPlateSplineGridTransform(sourceArray, targetArray, spacing)
+    if transform is not None:
+      transformNode.SetAndObserveTransformToParent(transform)
     # display
     transformNode.CreateDefaultDisplayNodes()
     transformNode.GetDisplayNode().SetVisibility(1)
@@ -550,6 +702,37 @@ class WarpDriveLogic(ScriptedLoadableModuleLogic):
     transformNode.GetDisplayNode().SetVisibility2D(1)
     return transformNode, sourceDisplayFiducial
 
+  @staticmethod
+  def selectedControlPointIndexes(markupsNode):
+    # the points passed to the cli, used for the preview and the gpu path too
+    return [i for i in range(markupsNode.GetNumberOfControlPoints()) if markupsNode.GetNthControlPointSelected(i)]
+
+  @staticmethod
+  def getControlPointRadius(markupsNode, index, defaultRadius):
+    try:
+      return float(markupsNode.GetNthControlPointDescription(index))
+    except ValueError:
+      return defaultRadius
+
+  def compactRBFGridTransform(self, sourceArray, targetArray, radii, pointIDs, spacing):
+    # only recompute the patches of control points that changed
+    patches = []
+    for n in range(sourceArray.shape[0]):
+      pointID = pointIDs[n] if pointIDs else None
+      key = (tuple(sourceArray[n]), radii[n], spacing)
+      if pointID in self._rbfPatchCache and self._rbfPatchCache[pointID][0] == key:
+        patch = self._rbfPatchCache[pointID][1]
+      else:
+        patch = RBFHelper.wendlandPatch(sourceArray[n], radii[n], spacing)
+        if pointID is not None:
+          self._rbfPatchCache[pointID] = (key, patch)
+      patches.append(patch)
+    # forget removed or unselected control points
+    if pointIDs:
+      for pointID in set(self._rbfPatchCache) - set(pointIDs):
+        del self._rbfPatchCache[pointID]
+    return RBFHelper.wendlandGridTransform(patches, targetArray - sourceArray, spacing)
+
 
 #
 # WarpDriveTest
@@ -572,6 +755,8 @@ class WarpDriveTest(ScriptedLoadableModuleTest):
     """
     self.setUp()
     self.test_WarpDrive1()
+    self.setUp()
+    self.test_solveGaussianRBF()
 
   def test_WarpDrive1(self):
     """ Ideally you should have several levels of tests.  At the lowest level
@@ -621,3 +806,25 @@ class WarpDriveTest(ScriptedLoadableModuleTest):
     self.assertEqual(outputScalarRange[1], inputScalarRange[1])
 
     self.delayDisplay('Test passed')
+
+  def test_solveGaussianRBF(self):
+    """ The cholesky solve (fresh, cached and appending a point) should match the svd solve of the cli,
+    also for clustered points where the system is close to singular.
+    """
+    rng = np.random.default_rng(0)
+    spread = np.column_stack([np.linspace(0, 40, 21), rng.uniform(-20, 20, (21, 2))])
+    collinear5 = np.column_stack([np.arange(21) * 5., np.zeros((21, 2))])
+    collinear8 = np.column_stack([np.arange(21) * 8., np.zeros((21, 2))])
+    for fixedPoints, stiffness in [(spread, 0), (spread, 0.1), (collinear5, 0), (collinear5, 0.1), (collinear8, 0)]:
+      logic = WarpDriveLogic()
+      movingPoints = fixedPoints + rng.uniform(-2, 2, fixedPoints.shape)
+      radii = np.full(fixedPoints.shape[0], 15.)
+      # fresh and cached solve with all but the last point, then append the last point
+      for n in [-1, -1, None]:
+        expected = RBFHelper.gaussianRBFCoefficients(fixedPoints[:n], movingPoints[:n], radii[:n], stiffness)
+        coefficients = logic.solveGaussianRBF(fixedPoints[:n], movingPoints[:n], radii[:n], stiffness)
+        # compare the displacements at the points
+        phi = RBFHelper.gaussianRBFKernel(fixedPoints[:n], radii[:n])[0]
+        np.testing.assert_allclose(phi @ coefficients, phi @ expected, atol=1e-3)
+
+    self.delayDisplay('Test passed')
@@ -1,4 +1,6 @@
 import vtk, slicer
+import numpy as np
+from vtk.util import numpy_support
 
 
 def getGridDefinition(node):
@@ -23,6 +25,22 @@ def getGridDefinition(node):
 
   return size,origin,spacing
 
+def isGridTransformWithGeometry(transform, size, origin, spacing):
+  if not isinstance(transform, slicer.vtkOrientedGridTransform) or not transform.GetDisplacementGrid():
+    return False
+  grid = transform.GetDisplacementGrid()
+  gridDirectionMatrix = transform.GetGridDirectionMatrix()
+  identityDirections = not gridDirectionMatrix or all(gridDirectionMatrix.GetElement(i,j) == (i==j) for i in range(3) for j in range(3))
+  return identityDirections and tuple(grid.GetDimensions()) == tuple(size)\
+    and all(abs(a-b) < 1e-6 for a,b in zip(grid.GetOrigin(), origin))\
+    and all(abs(a-b) < 1e-6 for a,b in zip(grid.GetSpacing(), spacing))
+
+def isZeroDisplacementGridTransform(transform):
+  if not isinstance(transform, slicer.vtkOrientedGridTransform) or not transform.GetDisplacementGrid():
+    return False
+  displacement = numpy_support.vtk_to_numpy(transform.GetDisplacementGrid().GetPointData().GetScalars())
+  return not np.any(displacement * transform.GetDisplacementScale() + transform.GetDisplacementShift())
+
 def getTransformRASToIJK(transformNode):
   size,origin,spacing = getGridDefinition(transformNode)
   IJKToRAS = [ 
@@ -61,22 +79,101 @@ def emptyGridTransform(transformSize = [193,229,193], transformOrigin = [-96.0,
 
   return transformNode
 
+def quantizeGridTransform(transformNode):
+  # store displacements as 16 bit integers with a global scale, vtk applies the scale on evaluation
+  transform = transformNode.GetTransformFromParent()
+  if not isinstance(transform, slicer.vtkOrientedGridTransform) or not transform.GetDisplacementGrid():
+    return
+  grid = transform.GetDisplacementGrid()
+  if grid.GetScalarType() == vtk.VTK_SHORT:
+    return
+  displacement = numpy_support.vtk_to_numpy(grid.GetPointData().GetScalars()) * transform.GetDisplacementScale() + transform.GetDisplacementShift()
+  maxDisplacement = np.abs(displacement).max()
+  scale = maxDisplacement / np.iinfo(np.int16).max if maxDisplacement > 0 else 1.0
+  imageData = vtk.vtkImageData()
+  imageData.SetDimensions(grid.GetDimensions())
+  imageData.SetOrigin(grid.GetOrigin())
+  imageData.SetSpacing(grid.GetSpacing())
+  imageData.GetPointData().SetScalars(numpy_support.numpy_to_vtk(np.round(displacement / scale).astype(np.int16), deep=1))
+  transform.SetDisplacementGridData(imageData)
+  transform.SetDisplacementScale(scale)
+  transform.SetDisplacementShift(0)
 
-def emptyVolume(imageSize, imageOrigin, imageSpacing):
+def invertGridTransform(transform, referenceVolumeNode, tolerance=0.1):
+  # inverse of the displacement field by fixed point iteration, resampled on the reference volume geometry.
+  # returns None where it can not be trusted: reference extending past the forward grid or not converged.
+  import SimpleITK as sitk
+  grid = transform.GetDisplacementGrid()
+  gridDirectionMatrix = transform.GetGridDirectionMatrix()
+  gridDirections = np.array([[gridDirectionMatrix.GetElement(i,j) for j in range(3)] for i in range(3)])
+  referenceIJKToRAS = vtk.vtkMatrix4x4()
+  referenceVolumeNode.GetIJKToRASMatrix(referenceIJKToRAS)
+  referenceSize = referenceVolumeNode.GetImageData().GetDimensions()
+  corners = np.array([referenceIJKToRAS.MultiplyPoint([i,j,k,1])[:3] for i in (0,referenceSize[0]-1) for j in (0,referenceSize[1]-1) for k in (0,referenceSize[2]-1)])
+  cornersIJK = (corners - grid.GetOrigin()) @ gridDirections / grid.GetSpacing()
+  if (cornersIJK < -1e-3).any() or (cornersIJK > np.array(grid.GetDimensions()) - 1 + 1e-3).any():
+    return None
+  # forward field in float32
+  displacement = numpy_support.vtk_to_numpy(grid.GetPointData().GetScalars()).astype(np.float32)
+  if transform.GetDisplacementScale() != 1 or transform.GetDisplacementShift() != 0:
+    displacement = displacement * np.float32(transform.GetDisplacementScale()) + np.float32(transform.GetDisplacementShift())
+  field = sitk.GetImageFromArray(displacement.reshape(grid.GetDimensions()[::-1] + (3,)), isVector=True)
+  del displacement
+  field.SetOrigin(grid.GetOrigin())
+  field.SetSpacing(grid.GetSpacing())
+  field.SetDirection(gridDirections.flatten().tolist())
+  inverseField = sitk.IterativeInverseDisplacementField(field, numberOfIterations=20, stopValue=0.0)
+  # check d(y + dinv(y)) + dinv(y) ~ 0 on the grid points covering the reference,
+  # pre-images outside the forward grid get a large default value and fail the check
+  inverseTransform = sitk.DisplacementFieldTransform(sitk.Cast(inverseField, sitk.sitkVectorFloat64))
+  composed = sitk.Resample(field, field, inverseTransform, sitk.sitkLinear, 1e6, sitk.sitkVectorFloat32)
+  del field, inverseTransform
+  start = np.maximum(np.floor(cornersIJK.min(axis=0)).astype(int), 0)
+  stop = np.ceil(cornersIJK.max(axis=0)).astype(int) + 1
+  region = slice(start[2], stop[2]), slice(start[1], stop[1]), slice(start[0], stop[0])
+  residual = sitk.GetArrayViewFromImage(composed)[region] + sitk.GetArrayViewFromImage(inverseField)[region]
+  if np.sqrt((residual**2).sum(axis=-1)).max() > tolerance * min(grid.GetSpacing()):
+    return None
+  del composed, residual
+  # reference geometry
+  directionMatrix = vtk.vtkMatrix4x4()
+  referenceVolumeNode.GetIJKToRASDirectionMatrix(directionMatrix)
+  referenceImage = sitk.Image(referenceSize, sitk.sitkUInt8)
+  referenceImage.SetOrigin(referenceVolumeNode.GetOrigin())
+  referenceImage.SetSpacing(referenceVolumeNode.GetSpacing())
+  referenceImage.SetDirection([directionMatrix.GetElement(i,j) for i in range(3) for j in range(3)])
+  inverseField = sitk.Resample(inverseField, referenceImage, sitk.Transform(), sitk.sitkLinear, 0.0, sitk.sitkVectorFloat32)
+  inverseDisplacement = sitk.GetArrayFromImage(inverseField).reshape(-1, 3)
+  del inverseField
+  # to grid transform (the vtk array references the numpy buffer, no extra copy)
+  imageData = vtk.vtkImageData()
+  imageData.SetDimensions(referenceSize)
+  imageData.SetOrigin(referenceImage.GetOrigin())
+  imageData.SetSpacing(referenceImage.GetSpacing())
+  imageData.GetPointData().SetScalars(numpy_support.numpy_to_vtk(inverseDisplacement, deep=0))
+  inverseTransform = slicer.vtkOrientedGridTransform()
+  inverseTransform.SetInterpolationModeToCubic()
+  inverseTransform.SetDisplacementGridData(imageData)
+  inverseTransform.SetGridDirectionMatrix(directionMatrix)
+  return inverseTransform
+
+def emptyVolume(imageSize, imageOrigin, imageSpacing, allocateScalars=True):
   voxelType = vtk.VTK_UNSIGNED_CHAR
   imageDirections = [[1,0,0], [0,1,0], [0,0,1]]
   fillVoxelValue = 0
   # Create an empty image volume, filled with fillVoxelValue
   imageData = vtk.vtkImageData()
   imageData.SetDimensions(imageSize)
-  imageData.AllocateScalars(voxelType, 1)
-  imageData.GetPointData().GetScalars().Fill(fillVoxelValue)
+  if allocateScalars:
+    imageData.AllocateScalars(voxelType, 1)
+    imageData.GetPointData().GetScalars().Fill(fillVoxelValue)
   # Create volume node
   volumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
   volumeNode.SetOrigin(imageOrigin)
   volumeNode.SetSpacing(imageSpacing)
   volumeNode.SetIJKToRASDirections(imageDirections)
   volumeNode.SetAndObserveImageData(imageData)
-  volumeNode.CreateDefaultDisplayNodes()
+  if allocateScalars:
+    volumeNode.CreateDefaultDisplayNodes()
 
   return volumeNode
\ No newline at end of file
@@ -1,5 +1,6 @@
 import vtk, qt, slicer
 import os
+import logging
 import json
 
 from . import GridNodeHelper
@@ -7,9 +8,14 @@ from . import GridNodeHelper
 def saveApprovedData(normalizationMethodFile):
   with open(normalizationMethodFile, 'r') as f:
     normalizationMethod = json.load(f)
-    normalizationMethod['approval'] = 1
-  with open(normalizationMethodFile, 'w') as f:
+  if normalizationMethod.get('approval') == 1:
+    return
+  normalizationMethod['approval'] = 1
+  # write to a temporary file and replace so the original is never left truncated
+  tmpFile = normalizationMethodFile + '.tmp'
+  with open(tmpFile, 'w') as f:
     json.dump(normalizationMethod, f)
+  os.replace(tmpFile, normalizationMethodFile)
 
 def queryUserApproveSubject():
   msgBox = qt.QMessageBox()
@@ -27,59 +33,91 @@ def applyChanges(inputNode, imageNode, forwardWarpPath, inverseWarpPath):
   # undo changes to image node
   imageNode.SetAndObserveTransformNodeID(None)
 
-  # FORWARD
-  
-  size, origin, spacing = GridNodeHelper.getGridDefinition(inputNode)
-  # harden changes in input
-  inputNode.HardenTransform()
-  # to grid transform
-  outNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLTransformNode')
-  referenceVolume = GridNodeHelper.emptyVolume(size, origin, spacing)    
-  slicer.modules.transforms.logic().ConvertToGridTransform(inputNode, referenceVolume, outNode)
-  # set to input and delete aux
-  inputNode.SetAndObserveTransformFromParent(outNode.GetTransformFromParent())
-  slicer.mrmlScene.RemoveNode(outNode)
-  slicer.mrmlScene.RemoveNode(referenceVolume)
-  # save
-  slicer.util.saveNode(inputNode, forwardWarpPath)
+  # mrml nodes are not thread safe, so the work stays on the main thread.
+  # events are processed between phases and the cursor is always restored.
+  try:
 
-  # BACKWARD
+    # FORWARD
+    
+    size, origin, spacing = GridNodeHelper.getGridDefinition(inputNode)
+    # if there are no changes (parent is an empty grid) and the input is already a grid with this geometry
+    # hardening would only leave a composite to be resampled again, so just detach it
+    parentNode = inputNode.GetParentTransformNode()
+    noChanges = parentNode is None or (parentNode.GetParentTransformNode() is None and GridNodeHelper.isZeroDisplacementGridTransform(parentNode.GetTransformFromParent()))
+    if noChanges and GridNodeHelper.isGridTransformWithGeometry(inputNode.GetTransformFromParent(), size, origin, spacing):
+      inputNode.SetAndObserveTransformNodeID(None)
+    else:
+      # harden changes in input
+      inputNode.HardenTransform()
+      # to grid transform
+      outNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLTransformNode')
+      # only the geometry of the reference is used, no need to allocate voxels
+      referenceVolume = GridNodeHelper.emptyVolume(size, origin, spacing, allocateScalars=False)
+      slicer.modules.transforms.logic().ConvertToGridTransform(inputNode, referenceVolume, outNode)
+      # set to input and delete aux
+      inputNode.SetAndObserveTransformFromParent(outNode.GetTransformFromParent())
+      slicer.mrmlScene.RemoveNode(outNode)
+      slicer.mrmlScene.RemoveNode(referenceVolume)
+    # save
+    slicer.util.saveNode(inputNode, forwardWarpPath)
+    qt.QApplication.processEvents()
 
-  inputNode.Inverse()
-  # to grid
-  outNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLTransformNode')
-  slicer.modules.transforms.logic().ConvertToGridTransform(inputNode, imageNode, outNode)
-  # save
-  slicer.util.saveNode(outNode, inverseWarpPath)
-  # delete aux node
-  slicer.mrmlScene.RemoveNode(outNode)
-  
-  # back to original
-  inputNode.Inverse()
-  imageNode.SetAndObserveTransformNodeID(inputNode.GetID())
-  
-  qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.ArrowCursor))
+    # BACKWARD
+
+    # invert the forward grid instead of rasterizing the inverted transform again.
+    # falls back when the image extends past the forward grid (inverse unknown there)
+    try:
+      inverseTransform = GridNodeHelper.invertGridTransform(inputNode.GetTransformFromParent(), imageNode)
+    except Exception as e:
+      logging.warning("Could not invert grid transform, falling back to ConvertToGridTransform: %s" % e)
+      inverseTransform = None
+    outNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLTransformNode')
+    if inverseTransform is not None:
+      outNode.SetAndObserveTransformFromParent(inverseTransform)
+    else:
+      logging.info("Computing inverse warp with ConvertToGridTransform")
+      inputNode.Inverse()
+      slicer.modules.transforms.logic().ConvertToGridTransform(inputNode, imageNode, outNode)
+      inputNode.Inverse()
+    # save
+    slicer.util.saveNode(outNode, inverseWarpPath)
+    # delete aux node
+    slicer.mrmlScene.RemoveNode(outNode)
+
+  finally:
+    # back to original
+    imageNode.SetAndObserveTransformNodeID(inputNode.GetID())
+    qt.QApplication.restoreOverrideCursor()
 
 
 def saveSourceTarget(warpDriveSavePath, sourceNode, targetNode):
   """
   Save source and target in subject directory so will be loaded next time
   """
-  if not os.path.isdir(warpDriveSavePath):
-    os.mkdir(warpDriveSavePath)  
-  slicer.util.saveNode(sourceNode, os.path.join(warpDriveSavePath, 'source.json'))
-  slicer.util.saveNode(targetNode, os.path.join(warpDriveSavePath, 'target.json'))
+  os.makedirs(warpDriveSavePath, exist_ok=True)
+  saveNodeAndReplace(sourceNode, os.path.join(warpDriveSavePath, 'source.json'))
+  saveNodeAndReplace(targetNode, os.path.join(warpDriveSavePath, 'target.json'))
+
+def saveNodeAndReplace(node, filePath):
+  """
+  Save to a temporary file next to filePath and swap it in, so an interrupted save keeps the previous file
+  """
+  root, ext = os.path.splitext(filePath)
+  tmpFilePath = root + '.tmp' + ext
+  if not slicer.util.saveNode(node, tmpFilePath):
+    return False
+  os.replace(tmpFilePath, filePath)
+  node.GetStorageNode().SetFileName(filePath)
+  return True
 
 def getAtlasesNamesInScene():
   shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-  folderNodes = slicer.mrmlScene.GetNodesByClass('vtkMRMLFolderDisplayNode')
-  folderNodes.UnRegister(slicer.mrmlScene)
+  sceneItemID = shNode.GetSceneItemID()
   names = []
-  for i in range(folderNodes.GetNumberOfItems()):
-    folderNode = folderNodes.GetItemAsObject(i)
-    if 'atlas' in shNode.GetItemAttributeNames(shNode.GetItemByDataNode(folderNode)):
-      if  shNode.GetItemParent(shNode.GetItemByDataNode(folderNode)) == shNode.GetSceneItemID():
-        names.append(folderNode.GetName())
+  for folderNode in slicer.util.getNodesByClass('vtkMRMLFolderDisplayNode'):
+    folderID = shNode.GetItemByDataNode(folderNode)
+    if shNode.GetItemAttribute(folderID, 'atlas') != '' and shNode.GetItemParent(folderID) == sceneItemID:
+      names.append(folderNode.GetName())
   return names
 
 def saveSceneInfo(warpDriveSavePath):
@@ -0,0 +1,191 @@
+import vtk, slicer
+import numpy as np
+from scipy import linalg
+from scipy.spatial.distance import cdist
+from vtk.util import numpy_support
+
+
+def thinPlateSplineCoefficients(sourcePoints, targetPoints):
+  # linear kernel plus affine part (same system as vtkThinPlateSplineTransform with basis R)
+  N = sourcePoints.shape[0]
+  A = np.zeros((N+4, N+4))
+  A[:N,:N] = cdist(sourcePoints, sourcePoints)
+  A[:N,N] = 1
+  A[:N,N+1:] = sourcePoints
+  A[N:,:N] = A[:N,N:].T
+  b = np.zeros((N+4, 3))
+  b[:N] = targetPoints
+  # least squares so that less than four (or coplanar) landmarks are handled
+  coefficients = np.linalg.lstsq(A, b, rcond=None)[0]
+  return coefficients[:N], coefficients[N:]
+
+def evaluateThinPlateSpline(points, sourcePoints, weights, affine, maxChunkElements=2**20):
+  out = np.empty((points.shape[0], 3), dtype=np.float32)
+  # chunk rows to cap the size of the distance matrix
+  rows = max(1, maxChunkElements // max(1, sourcePoints.shape[0]))
+  for start in range(0, points.shape[0], rows):
+    chunk = points[start:start+rows]
+    out[start:start+rows] = cdist(chunk, sourcePoints) @ weights + chunk @ affine[1:] + affine[0]
+  return out
+
+def getGridPoints(size, origin, spacing):
+  # RAS coordinates of grid points, x index running fastest (vtkImageData order)
+  k, j, i = np.mgrid[:size[2], :size[1], :size[0]]
+  return np.stack([i, j, k], axis=-1).reshape(-1, 3) * spacing + origin
+
+def gridTransformFromDisplacement(displacement, size, origin, spacing):
+  imageData = vtk.vtkImageData()
+  imageData.SetDimensions(size)
+  imageData.SetOrigin(origin)
+  imageData.SetSpacing(spacing)
+  imageData.GetPointData().SetScalars(numpy_support.numpy_to_vtk(np.ascontiguousarray(displacement, dtype=np.float32).reshape(-1, 3), deep=1))
+  transform = slicer.vtkOrientedGridTransform()
+  transform.SetInterpolationModeToCubic()
+  transform.SetDisplacementGridData(imageData)
+  return transform
+
+def thinPlateSplineGridTransform(sourcePoints, targetPoints, spacing):
+  # coarse grid around the landmarks
+  margin = 2 * spacing
+  origin = sourcePoints.min(axis=0) - margin
+  size = [int(s) for s in np.ceil((sourcePoints.max(axis=0) + margin - origin) / spacing) + 1]
+  gridPoints = getGridPoints(size, origin, spacing)
+  # solve once and evaluate on the whole grid
+  weights, affine = thinPlateSplineCoefficients(sourcePoints, targetPoints)
+  displacement = evaluateThinPlateSpline(gridPoints, sourcePoints, weights, affine) - gridPoints
+  return gridTransformFromDisplacement(displacement, size, origin, [spacing] * 3)
+
+def wendlandPatch(center, radius, spacing):
+  # Wendland C2 kernel evaluated only on the grid points within radius.
+  # The grid is anchored at the world origin so patches stay valid between calls.
+  # A non positive radius has no support and gives an empty patch.
+  if radius <= 0:
+    return np.floor(center / spacing).astype(int), np.zeros((0, 0, 0), dtype=np.float32)
+  start = np.ceil((center - radius) / spacing).astype(int)
+  stop = np.floor((center + radius) / spacing).astype(int) + 1
+  k, j, i = np.mgrid[start[2]:stop[2], start[1]:stop[1], start[0]:stop[0]]
+  r = np.sqrt((i * spacing - center[0])**2 + (j * spacing - center[1])**2 + (k * spacing - center[2])**2) / radius
+  phi = np.maximum(0, 1 - r)**4 * (4 * r + 1)
+  return start, phi.astype(np.float32)
+
+def wendlandGridTransform(patches, displacements, spacing):
+  # skip empty patches, None if nothing is left
+  nonEmpty = [n for n, (start, phi) in enumerate(patches) if phi.size]
+  if not nonEmpty:
+    return None
+  patches = [patches[n] for n in nonEmpty]
+  displacements = [displacements[n] for n in nonEmpty]
+  starts = np.array([start for start,phi in patches])
+  stops = np.array([start + phi.shape[::-1] for start,phi in patches])
+  origin = starts.min(axis=0)
+  size = stops.max(axis=0) - origin
+  field = np.zeros((size[2], size[1], size[0], 3), dtype=np.float32)
+  weights = np.zeros((size[2], size[1], size[0]), dtype=np.float32)
+  for (start, phi), displacement in zip(patches, displacements):
+    i, j, k = start - origin
+    index = slice(k, k+phi.shape[0]), slice(j, j+phi.shape[1]), slice(i, i+phi.shape[2])
+    field[index] += phi[..., np.newaxis] * displacement.astype(np.float32)
+    weights[index] += phi
+  # normalize where kernels overlap so dense corrections do not accumulate
+  field /= np.maximum(weights, 1)[..., np.newaxis]
+  return gridTransformFromDisplacement(field, [int(s) for s in size], origin * spacing, [spacing] * 3)
+
+def gaussianRBFKernel(fixedPoints, radii):
+  # phi[k,i] = rbf of point i at point k, built in place from the squared distances
+  squaredDistances = cdist(fixedPoints, fixedPoints, 'sqeuclidean')
+  phi = squaredDistances / -radii[:, np.newaxis]**2
+  np.exp(phi, out=phi)
+  return phi, squaredDistances
+
+def gaussianRBFRegularization(squaredDistances, rowRadii, columnRadii, stiffness, meanRadius):
+  r2 = squaredDistances / (rowRadii[:, np.newaxis] * columnRadii[np.newaxis])
+  regularization = r2 - 5.
+  np.square(regularization, out=regularization)
+  regularization -= 10
+  r2 *= -0.5
+  np.exp(r2, out=r2)
+  regularization *= r2
+  regularization *= stiffness * np.sqrt(np.pi/2.)**3 / meanRadius
+  return regularization
+
+def gaussianRBFSystem(fixedPoints, radii, stiffness):
+  # same system as the fiducialRegistrationVariableRBF cli (gaussian kernel with a radius per point)
+  phi, squaredDistances = gaussianRBFKernel(fixedPoints, radii)
+  A = phi.T @ phi
+  if stiffness:
+    A += gaussianRBFRegularization(squaredDistances, radii, radii, stiffness, radii.mean())
+  return A, phi
+
+def gaussianRBFCoefficients(fixedPoints, movingPoints, radii, stiffness):
+  A, phi = gaussianRBFSystem(fixedPoints, radii, stiffness)
+  # svd solve like the cli (vnl_svd with an absolute cutoff: singular values <= 1e-6 are zeroed)
+  U, s, Vt = np.linalg.svd(A)
+  sInv = np.zeros_like(s)
+  sInv[s > 1e-6] = 1. / s[s > 1e-6]
+  return Vt.T @ (sInv[:, np.newaxis] * (U.T @ (phi.T @ (movingPoints - fixedPoints))))
+
+def isSafelyPositiveDefinite(A, tolerance=1e-6):
+  # the cli zeroes singular values <= 1e-6, only use cholesky if none would be
+  return linalg.eigvalsh(A, subset_by_index=[0, 0], check_finite=False)[0] > tolerance
+
+def gaussianRBFCholesky(fixedPoints, radii, stiffness):
+  # returns None if the system is not (safely) positive definite
+  A, phi = gaussianRBFSystem(fixedPoints, radii, stiffness)
+  if not isSafelyPositiveDefinite(A):
+    return None, phi
+  # A is a temporary, factor it in place
+  return linalg.cholesky(A, lower=True, overwrite_a=True, check_finite=False), phi
+
+def choleskyRankOneUpdate(L, x):
+  # factor of L L^T + x x^T in O(n^2)
+  L = L.copy()
+  x = x.copy()
+  for k in range(x.size):
+    r = np.hypot(L[k,k], x[k])
+    c = r / L[k,k]
+    s = x[k] / L[k,k]
+    L[k,k] = r
+    L[k+1:,k] = (L[k+1:,k] + s * x[k+1:]) / c
+    x[k+1:] = c * x[k+1:] - s * L[k+1:,k]
+  return L
+
+def gaussianRBFCholeskyAppendPoint(L, fixedPoints, radii, stiffness):
+  # Factor of the system after appending the last point, given the factor without it.
+  # The new point adds a row to phi (rank one update of the previous block) and a border row/column.
+  # Assumes the mean radius (regularization prefactor) did not change.
+  n = L.shape[0]
+  phi, squaredDistances = gaussianRBFKernel(fixedPoints, radii)
+  border = phi.T @ phi[:, n]
+  if stiffness:
+    border += gaussianRBFRegularization(squaredDistances[:, n:], radii, radii[n:], stiffness, radii.mean())[:, 0]
+  L = choleskyRankOneUpdate(L, phi[n, :n])
+  l = linalg.solve_triangular(L, border[:n], lower=True)
+  d = border[n] - l @ l
+  if d <= 0:
+    return None, phi
+  newL = np.zeros((n+1, n+1))
+  newL[:n,:n] = L
+  newL[n,:n] = l
+  newL[n,n] = np.sqrt(d)
+  return (newL if isSafelyPositiveDefinite(newL @ newL.T) else None), phi
+
+def evaluateGaussianRBFGrid(size, origin, spacing, fixedPoints, radii, coefficients, xp=np, maxChunkElements=2**26):
+  # xp is the array module (numpy or cupy) used for the evaluation
+  fixedPoints = xp.asarray(fixedPoints, dtype=xp.float32)
+  radii2 = xp.asarray(radii, dtype=xp.float32)**2
+  coefficients = xp.asarray(coefficients, dtype=xp.float32)
+  origin = xp.asarray(origin, dtype=xp.float32)
+  spacing = xp.asarray(spacing, dtype=xp.float32)
+  displacement = np.empty((size[2], size[1], size[0], 3), dtype=np.float32)
+  # slabs along z to cap the size of the kernel matrix
+  slabSize = max(1, maxChunkElements // (size[0] * size[1] * fixedPoints.shape[0]))
+  for k0 in range(0, size[2], slabSize):
+    k1 = min(k0 + slabSize, size[2])
+    k, j, i = xp.mgrid[k0:k1, :size[1], :size[0]]
+    points = xp.stack([i, j, k], axis=-1).reshape(-1, 3).astype(xp.float32) * spacing + origin
+    d2 = (points**2).sum(axis=1)[:, np.newaxis] + (fixedPoints**2).sum(axis=1)[np.newaxis] - 2 * points @ fixedPoints.T
+    slab = xp.exp(-xp.maximum(d2, 0) / radii2) @ coefficients
+    if xp is not np:
+      slab = xp.asnumpy(slab)
+    displacement[k0:k1] = slab.reshape(k1-k0, size[1], size[0], 3)
+  return displacement
@@ -171,9 +171,7 @@ class DrawToolEffect(AbstractDrawEffect):
     globalMinDistance = 1000
     outPolyData = vtk.vtkPolyData()
     # iterate over models in scene
-    nModels = slicer.mrmlScene.GetNumberOfNodesByClass('vtkMRMLModelNode')
-    for i in range(nModels):
-      model = slicer.mrmlScene.GetNthNodeByClass(i, 'vtkMRMLModelNode')
+    for model in slicer.util.getNodesByClass('vtkMRMLModelNode'):
       polyData = model.GetPolyData()
       if model.GetDisplayNode() and model.GetDisplayNode().GetVisibility() and polyData.GetNumberOfCells() > 1 and model.GetName()!= 'auxSphereModel': # model visible and cells available
         cutter.SetInputData(polyData)
@@ -4,6 +4,7 @@ from PythonQt import BoolResult
 from slicer.util import VTKObservationMixin
 import WarpDrive, ImportAtlas
 import numpy as np
+from vtk.util import numpy_support
 
 class TextEditDelegate(qt.QItemDelegate):
   def __init__(self, parent, renameControlPointsFunction):
@@ -153,7 +154,8 @@ class AtlasesTable(baseTable):
       qt.QApplication.setOverrideCursor(qt.Qt.WaitCursor)
       qt.QApplication.processEvents()
       try:
-        ImportAtlas.ImportAtlasLogic().readAtlas(os.path.join(ImportAtlas.ImportAtlasLogic().getAtlasesPath(), atlasName, 'atlas_index.mat'))    
+        importAtlasLogic = ImportAtlas.ImportAtlasLogic()
+        importAtlasLogic.readAtlas(os.path.join(importAtlasLogic.getAtlasesPath(), atlasName, 'atlas_index.mat'))
       finally:
         qt.QApplication.restoreOverrideCursor()
     self.updateTable()
@@ -166,8 +168,13 @@ class AtlasesTable(baseTable):
     removeIDs = vtk.vtkIdList()
     shNode.GetItemChildren(nodeID, removeIDs, True)
     removeIDs.InsertNextId(nodeID)
-    for i in range(removeIDs.GetNumberOfIds()):
-      shNode.RemoveItem(removeIDs.GetId(i))
+    # single scene update for all removed items
+    slicer.mrmlScene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+    try:
+      for i in range(removeIDs.GetNumberOfIds()):
+        shNode.RemoveItem(removeIDs.GetId(i))
+    finally:
+      slicer.mrmlScene.EndState(slicer.vtkMRMLScene.BatchProcessState)
 
   def onDoubleClick(self):
     nodeID = self.view.currentItem()
@@ -403,10 +410,15 @@ class WarpDriveCorrectionsManager(VTKObservationMixin, WarpDriveCorrectionsTable
       return
     targetFiducialNode = slicer.mrmlScene.GetNodeByID(self.targetFiducialNodeID)
     sourceFiducialNode = slicer.mrmlScene.GetNodeByID(self.sourceFiducialNodeID)
+    # one modified event per node for all removed points
+    targetWasModifying = targetFiducialNode.StartModify()
+    sourceWasModifying = sourceFiducialNode.StartModify()
     for i in range(targetFiducialNode.GetNumberOfControlPoints()-1,-1,-1):
       if targetFiducialNode.GetNthControlPointLabel(i) == correctionName:
         targetFiducialNode.RemoveNthControlPoint(i)
         sourceFiducialNode.RemoveNthControlPoint(i)
+    sourceFiducialNode.EndModify(sourceWasModifying)
+    targetFiducialNode.EndModify(targetWasModifying)
     self.parameterNode.SetParameter("Update","true")
 
   def renameControlPoints(self, previousName, newName):
@@ -453,19 +465,16 @@ class WarpDriveCorrectionsManager(VTKObservationMixin, WarpDriveCorrectionsTable
     correctionName = self.getSelectedCorrectionName()
     if correctionName is None:
       return
-    jumped = False
-    sourcePoints = vtk.vtkPoints()
-    targetPoints = vtk.vtkPoints()
     targetFiducialNode = slicer.mrmlScene.GetNodeByID(self.targetFiducialNodeID)
     sourceFiducialNode = slicer.mrmlScene.GetNodeByID(self.sourceFiducialNodeID)
-    for i in range(targetFiducialNode.GetNumberOfControlPoints()):
-      if targetFiducialNode.GetNthControlPointLabel(i) == correctionName:
-        if not jumped:
-          markupsLogic = slicer.modules.markups.logic()
-          markupsLogic.JumpSlicesToNthPointInMarkup(self.targetFiducialNodeID,i,False)
-          jumped = True
-        sourcePoints.InsertNextPoint(sourceFiducialNode.GetNthControlPointPosition(i))
-        targetPoints.InsertNextPoint(targetFiducialNode.GetNthControlPointPosition(i))        
+    indexes = [i for i in range(targetFiducialNode.GetNumberOfControlPoints()) if targetFiducialNode.GetNthControlPointLabel(i) == correctionName]
+    if indexes:
+      slicer.modules.markups.logic().JumpSlicesToNthPointInMarkup(self.targetFiducialNodeID,indexes[0],False)
+    # bulk copy positions instead of inserting point by point
+    sourcePoints = vtk.vtkPoints()
+    sourcePoints.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(slicer.util.arrayFromMarkupsControlPoints(sourceFiducialNode)[indexes], dtype=np.float64), deep=1))
+    targetPoints = vtk.vtkPoints()
+    targetPoints.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(slicer.util.arrayFromMarkupsControlPoints(targetFiducialNode)[indexes], dtype=np.float64), deep=1))
     tmpNodes = WarpDrive.WarpDriveLogic().previewWarp(sourcePoints, targetPoints)
     for n in tmpNodes:
       qt.QTimer.singleShot(1000, lambda node=n: slicer.mrmlScene.RemoveNode(node))
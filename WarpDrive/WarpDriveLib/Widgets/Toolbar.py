@@ -3,7 +3,6 @@ from qt import QToolBar
 import os
 import json
 from slicer.util import VTKObservationMixin
-import glob
 import re
 
 import WarpDrive
@@ -111,9 +110,10 @@ class reducedToolbar(QToolBar, VTKObservationMixin):
     outputNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLGridTransformNode')
     inputNode.SetAndObserveTransformNodeID(outputNode.GetID())
 
-    if os.path.isfile(os.path.join(currentSubject["warpdrive_path"],'target.json')):
+    targetFileName = os.path.join(currentSubject["warpdrive_path"],'target.json')
+    if os.path.isfile(targetFileName):
       print("Loading previious session")
-      targetFiducial = slicer.util.loadMarkups(os.path.join(currentSubject["warpdrive_path"],'target.json'))
+      targetFiducial = slicer.util.loadMarkups(targetFileName)
       sourceFiducial = slicer.util.loadMarkups(os.path.join(currentSubject["warpdrive_path"],'source.json'))
     else:
       targetFiducial = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMarkupsFiducialNode')
@@ -129,10 +129,10 @@ class reducedToolbar(QToolBar, VTKObservationMixin):
     self.parameterNode.SetNodeReferenceID("SourceFiducial", sourceFiducial.GetID())
     self.parameterNode.SetNodeReferenceID("TargetFiducial", targetFiducial.GetID())
 
-    self.updateModalities()
-    self.onModalityPressed([], self.parameterNode.GetParameter("modality"))
+    self.updateModalities(currentSubject)
+    self.onModalityPressed([], self.parameterNode.GetParameter("modality"), currentSubject)
 
-    self.setUpAtlases()
+    self.setUpAtlases(currentSubject)
     print("Finish loading subject %s" % currentSubject["id"])
 
 
@@ -162,9 +162,10 @@ class reducedToolbar(QToolBar, VTKObservationMixin):
     slicer.mrmlScene.RemoveNode(self.parameterNode.GetNodeReference("ImageNode"))
     slicer.mrmlScene.RemoveNode(self.parameterNode.GetNodeReference("OutputGridTransform"))
     
-  def setUpAtlases(self):
+  def setUpAtlases(self, currentSubject=None):
     print("Set up atlases")
-    currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
+    if currentSubject is None:
+      currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
     jsonFileName = os.path.join(currentSubject["warpdrive_path"],'info.json')
     if os.path.isfile(jsonFileName):
       with open(jsonFileName, 'r') as jsonFile:
@@ -174,20 +175,19 @@ class reducedToolbar(QToolBar, VTKObservationMixin):
     atlasNames = info["atlasNames"] if info["atlasNames"] != [] else ['DISTAL Minimal (Ewert 2017)']
     # load atlas if not already in scene
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    folderNodes = slicer.mrmlScene.GetNodesByClass('vtkMRMLFolderDisplayNode')
-    folderNodes.UnRegister(slicer.mrmlScene)
-    for i in range(folderNodes.GetNumberOfItems()):
-      folderNode = folderNodes.GetItemAsObject(i)
-      if ('atlas' in shNode.GetItemAttributeNames(shNode.GetItemByDataNode(folderNode))) and (folderNode.GetName() in atlasNames):
+    for folderNode in slicer.util.getNodesByClass('vtkMRMLFolderDisplayNode'):
+      if (shNode.GetItemAttribute(shNode.GetItemByDataNode(folderNode), 'atlas') != '') and (folderNode.GetName() in atlasNames):
         atlasNames.pop(atlasNames.index(folderNode.GetName()))
+    importAtlasLogic = ImportAtlas.ImportAtlasLogic()
+    atlasesPath = importAtlasLogic.getAtlasesPath()
     for name in atlasNames:
       print("Loading atlas %s" % name)
       try:
-        ImportAtlas.ImportAtlasLogic().readAtlas(os.path.join(ImportAtlas.ImportAtlasLogic().getAtlasesPath(), name, 'atlas_index.mat'))
+        importAtlasLogic.readAtlas(os.path.join(atlasesPath, name, 'atlas_index.mat'))
       except:
         print("Could not load atlas %s" % name)
 
-  def onModalityPressed(self, item, modality=None):
+  def onModalityPressed(self, item, modality=None, currentSubject=None):
     if modality is None:
       modality = self.modalityComboBox.itemText(item.row())
     print("Loading %s modality" % modality)
@@ -195,14 +195,16 @@ class reducedToolbar(QToolBar, VTKObservationMixin):
     slicer.mrmlScene.RemoveNode(self.parameterNode.GetNodeReference("ImageNode"))
     slicer.mrmlScene.RemoveNode(self.parameterNode.GetNodeReference("TemplateNode"))
     # initialize new image and init
-    currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
+    if currentSubject is None:
+      currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
     imageNode = slicer.util.loadVolume(currentSubject["anat_files"][modality], properties={'show':False})
     imageNode.SetAndObserveTransformNodeID(self.parameterNode.GetNodeReferenceID("InputNode"))    
     # change to t1 in case modality not present
     mni_modality = re.findall(r'(?<=T)\d', modality) + ['1']
     mni_modality = mni_modality[0]
-    templateFile = glob.glob(os.path.join(self.parameterNode.GetParameter("MNIPath"), "t" + mni_modality + ".nii"))
-    templateFile = templateFile[0] if templateFile else os.path.join(self.parameterNode.GetParameter("MNIPath"), "t1.nii")
+    templateFile = os.path.join(self.parameterNode.GetParameter("MNIPath"), "t" + mni_modality + ".nii")
+    if not os.path.isfile(templateFile):
+      templateFile = os.path.join(self.parameterNode.GetParameter("MNIPath"), "t1.nii")
     templateNode = slicer.util.loadVolume(templateFile, properties={'show':False})
     templateNode.GetDisplayNode().AutoWindowLevelOff()
     templateNode.GetDisplayNode().SetWindow(100)
@@ -216,15 +218,17 @@ class reducedToolbar(QToolBar, VTKObservationMixin):
 
 
   def updateToolbarFromParameterNode(self, caller=None, event=None):
-    self.subjectNameLabel.text = 'Subject: ' + json.loads(self.parameterNode.GetParameter("CurrentSubject"))["id"]
-    self.subjectNameLabel.toolTip = os.path.dirname(json.loads(self.parameterNode.GetParameter("CurrentSubject"))["warpdrive_path"])
+    currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
+    self.subjectNameLabel.text = 'Subject: ' + currentSubject["id"]
+    self.subjectNameLabel.toolTip = os.path.dirname(currentSubject["warpdrive_path"])
     self.nextButton.text = 'Next' if len(json.loads(self.parameterNode.GetParameter("LeadSubjects"))) else 'Exit'
     self.modalityComboBox.setCurrentText(self.parameterNode.GetParameter("modality"))      
 
 
-  def updateModalities(self):
+  def updateModalities(self, currentSubject=None):
     print("Update modalities")
-    currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
+    if currentSubject is None:
+      currentSubject = json.loads(self.parameterNode.GetParameter("CurrentSubject"))
     currentModality = self.modalityComboBox.currentText
     subjectModalities = list(currentSubject["anat_files"].keys())
     self.modalityComboBox.clear()